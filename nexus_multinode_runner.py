@@ -1,33 +1,128 @@
 import subprocess
 import time
 import sys
-import tempfile
 import os
+import base64
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
+# How long WSL probe results stay cached, in seconds
+PROBE_CACHE_TTL = 60
+
+# How long wt.exe gets to hand the tabs over to Windows Terminal and exit
+WT_LAUNCH_TIMEOUT = 15
+
+# Windows caps a command line at 32767 characters. Tabs are packed into as
+# few wt invocations as fit under this (with some headroom).
+WT_MAX_CMDLINE = 30000
+
+# Windows temp directory, and the same directory as seen from inside WSL.
+# Converted once, e.g. 'C:\Users\...\Temp' -> '/mnt/c/Users/.../Temp'
+TEMP_DIR = os.path.abspath(os.environ.get('TEMP', '.'))
+WSL_TEMP_ROOT = "/mnt/" + TEMP_DIR[0].lower() + TEMP_DIR[2:].replace('\\', '/').rstrip('/')
+
+def kill_tree(proc):
+    """
+    Kills a process and all of its descendants.
+    Asks politely first (taskkill /T), then forces it (/F) after 1 second.
+    """
+    taskkill = ['taskkill', '/PID', str(proc.pid), '/T']
+    try:
+        subprocess.run(taskkill, capture_output=True, timeout=5)
+        try:
+            proc.wait(timeout=1)
+            return
+        except subprocess.TimeoutExpired:
+            pass
+        subprocess.run(taskkill + ['/F'], capture_output=True, timeout=5)
+    except (OSError, subprocess.TimeoutExpired):
+        pass # taskkill itself failed, fall through to killing the direct child
+    try:
+        proc.kill()
+    except OSError:
+        pass
+
+def run_with_timeout(cmd, timeout, **kwargs):
+    """
+    Like subprocess.run() with a mandatory timeout, except that on timeout
+    the whole process tree is killed rather than just the direct child.
+    TimeoutExpired is re-raised to the caller.
+    """
+    if kwargs.pop('capture_output', False):
+        kwargs['stdout'] = subprocess.PIPE
+        kwargs['stderr'] = subprocess.PIPE
+    with subprocess.Popen(cmd, **kwargs) as proc:
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_tree(proc)
+            raise
+    return subprocess.CompletedProcess(proc.args, proc.returncode, stdout, stderr)
+
+def ttl_cached(ttl):
+    """
+    Caches a function's result per argument tuple for `ttl` seconds.
+    Concurrent calls with the same arguments share one in-flight call
+    instead of each spawning their own wsl.exe.
+    """
+    def decorator(func):
+        lock = threading.Lock()
+        cache = {}      # key -> (expires_at, result)
+        in_flight = {}  # key -> Future of the call currently running
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = (func.__name__,) + args
+            with lock:
+                entry = cache.get(key)
+                if entry and entry[0] > time.monotonic():
+                    return entry[1]
+                future = in_flight.get(key)
+                is_owner = future is None
+                if is_owner:
+                    future = in_flight[key] = Future()
+
+            if not is_owner:
+                # Someone else is already running this call, wait for their result
+                return future.result()
+
+            try:
+                result = func(*args)
+            except BaseException as e:
+                with lock:
+                    del in_flight[key]
+                future.set_exception(e)
+                raise
+            with lock:
+                cache[key] = (time.monotonic() + ttl, result)
+                del in_flight[key]
+            future.set_result(result)
+            return result
+        return wrapper
+    return decorator
+
+@ttl_cached(PROBE_CACHE_TTL)
 def get_wsl_distros():
     """Gets the list of installed WSL distributions."""
     try:
-        # Added encoding 'utf-16-le' which is what wsl -l -q often outputs.
-        # Added .replace('\x00', '') to strip null characters which cause issues.
-        result = subprocess.run(
+        # wsl.exe writes UTF-16 (BOM-aware 'utf-16' decodes it cleanly, no
+        # stray null characters), unless WSL_UTF8=1 switches it to UTF-8.
+        encoding = 'utf-8' if os.environ.get('WSL_UTF8') == '1' else 'utf-16'
+        result = run_with_timeout(
             ["wsl", "-l", "-q"],
+            timeout=5,
             capture_output=True,
             text=True,
-            encoding='utf-16-le'
+            encoding=encoding
         )
-        lines = result.stdout.strip().replace('\x00', '').split('\n')
-        distros = [line.strip() for line in lines if line.strip() and '\x00' not in line]
-        if not distros:
-            # Fallback for other encodings
-            result = subprocess.run(
-                ["wsl", "-l", "-q"],
-                capture_output=True,
-                text=True
-            )
-            lines = result.stdout.strip().split('\n')
-            distros = [line.strip() for line in lines if line.strip()]
+        distros = [line.strip() for line in result.stdout.splitlines() if line.strip()]
 
         return distros
+    except subprocess.TimeoutExpired:
+        print("Error: Listing WSL distributions timed out (5s).")
+        print("This may be an issue with WSL. Please try restarting your computer or WSL (`wsl --shutdown`).")
+        sys.exit(1)
     except FileNotFoundError:
         print("Error: `wsl` command not found. Please ensure WSL is installed and in your PATH.")
         sys.exit(1)
@@ -36,65 +131,93 @@ def get_wsl_distros():
         print("Please ensure WSL is installed and `wsl -l -q` runs correctly in your terminal.")
         sys.exit(1)
 
+def prompt_int(message, lo, hi=None, default=None, max_tries=5):
+    """
+    Prompts until the user enters a whole number in [lo, hi] (hi=None means
+    no upper bound). An empty answer returns `default` if one is given.
+    Gives up after `max_tries` bad answers or when stdin is closed.
+    """
+    for _ in range(max_tries):
+        try:
+            answer = input(message).strip()
+        except EOFError:
+            print("\nNo input available. Exiting.")
+            sys.exit(1)
+        except KeyboardInterrupt:
+            print("\nOperation cancelled.")
+            sys.exit(0)
+
+        if not answer and default is not None:
+            return default
+        if not answer.isdecimal():
+            print("Invalid input. Please enter a number.")
+            continue
+        value = int(answer)
+        if value >= lo and (hi is None or value <= hi):
+            return value
+        if hi is None:
+            print(f"Invalid selection. Please enter a number of at least {lo}.")
+        else:
+            print(f"Invalid selection. Please enter a number between {lo} and {hi}.")
+
+    print(f"Too many invalid answers ({max_tries}). Exiting.")
+    sys.exit(1)
+
 def select_distro(distros):
     """Prompts user to select a WSL distribution."""
     print("\nAvailable WSL distributions:")
     for i, distro in enumerate(distros, 1):
         print(f"[{i}] {distro}")
 
-    while True:
-        try:
-            selection_input = input(f"\nEnter the number of the distribution to use (1-{len(distros)}): ")
-            selection = int(selection_input)
-            if 1 <= selection <= len(distros):
-                return distros[selection - 1]
-            else:
-                print(f"Invalid selection. Please enter a number between 1 and {len(distros)}.")
-        except ValueError:
-            print("Invalid input. Please enter a number.")
-        except KeyboardInterrupt:
-            print("\nOperation cancelled.")
-            sys.exit(0)
+    selection = prompt_int(f"\nEnter the number of the distribution to use (1-{len(distros)}): ", 1, len(distros))
+    return distros[selection - 1]
 
-def get_wsl_users(distro):
-    """Gets the list of 'real' users (UID 0 or >= 1000) from the selected WSL distribution."""
-    print(f"\nDetecting users in {distro}...")
-    
-    # FIX: We must escape the dollar signs ($) for bash by using \\$ in the Python string.
-    # This prevents 'bash -c' from trying to expand $3 and $1 as shell variables.
-    awk_command = "awk -F: '(\\$3 >= 1000 || \\$3 == 0) && \\$1 != \"nobody\" {print \\$1}' /etc/passwd"
-    
+@ttl_cached(PROBE_CACHE_TTL)
+def probe_wsl(distro):
+    """
+    Probes a WSL distribution for its 'real' users (UID 0 or >= 1000).
+    Returns a (distro, users) tuple. The result is cached for a short
+    while, so probing the same distro again does not cold-start wsl.exe.
+    """
     try:
-        # We pass the awk_command directly to 'bash -c'
-        result = subprocess.run(
-            ["wsl", "-d", distro, "--", "bash", "-c", awk_command],
+        # Read /etc/passwd directly (no shell, no awk) and filter it in Python
+        result = run_with_timeout(
+            ["wsl", "-d", distro, "--", "cat", "/etc/passwd"],
+            timeout=10, # Add a 10-second timeout
             capture_output=True,
             text=True,
-            encoding='utf-8', # Standard output from bash should be utf-8
-            timeout=10, # Add a 10-second timeout
+            encoding='utf-8', # Standard output from cat should be utf-8
+            errors='replace', # Only name and UID matter, don't choke on odd GECOS bytes
             stdin=subprocess.DEVNULL # Don't wait for stdin
         )
         if result.stderr:
             # Don't treat it as a fatal error, but show the message.
-            print(f"Warning detecting users: {result.stderr.strip()}")
-            # Continue, as awk might still have outputted something
-            
-        lines = result.stdout.strip().split('\n')
-        users = [line.strip() for line in lines if line.strip()]
-        
+            print(f"Warning detecting users in {distro}: {result.stderr.strip()}")
+            # Continue, as cat might still have outputted something
+
+        users = []
+        for line in result.stdout.splitlines():
+            # Format is name:password:UID:GID:...
+            fields = line.split(':', 3)
+            if len(fields) < 3 or not fields[2].isdecimal():
+                continue # Skip blank or malformed lines
+            name, uid = fields[0], int(fields[2])
+            if (uid == 0 or uid >= 1000) and name != "nobody":
+                users.append(name)
+
         if not users and result.stderr:
-             print(f"Could not detect users. Raw error: {result.stderr.strip()}")
-             print("Please ensure awk is installed in your WSL distro.")
-             return []
+             print(f"Could not detect users in {distro}. Raw error: {result.stderr.strip()}")
+             return distro, []
 
-        return users
+        return distro, users
     except subprocess.TimeoutExpired:
-        print(f"Error: The command to detect users in {distro} timed out (10s).")
-        print("This may be an issue with WSL. Please try restarting your computer or WSL (`wsl --shutdown`).")
-        sys.exit(1)
+        print(f"Warning: The command to detect users in {distro} timed out (10s), skipping it.")
+        print(f"If {distro} is stuck, try `wsl --terminate {distro}` or restarting WSL (`wsl --shutdown`).")
+        # Every distro is probed up front, so one bad distro must not stop the run
+        return distro, []
     except Exception as e:
-        print(f"Error running WSL command to get users: {e}")
-        sys.exit(1)
+        print(f"Error running WSL command to get users in {distro}: {e}")
+        return distro, []
 
 def select_user(users):
     """Prompts user to select a WSL user from a list."""
@@ -102,26 +225,13 @@ def select_user(users):
     for i, user in enumerate(users, 1):
         print(f"[{i}] {user}")
 
-    while True:
-        try:
-            selection_input = input(f"\nEnter the number of the user to run as (1-{len(users)}): ")
-            selection = int(selection_input)
-            if 1 <= selection <= len(users):
-                return users[selection - 1]
-            else:
-                print(f"Invalid selection. Please enter a number between 1 and {len(users)}.")
-        except ValueError:
-            print("Invalid input. Please enter a number.")
-        except KeyboardInterrupt:
-            print("\nOperation cancelled.")
-            sys.exit(0)
+    selection = prompt_int(f"\nEnter the number of the user to run as (1-{len(users)}): ", 1, len(users))
+    return users[selection - 1]
 
-def read_commands(filename):
-    """Reads commands from a file."""
+def open_commands(filename):
+    """Opens the command file, exiting with a message if it can't be read."""
     try:
-        with open(filename, 'r') as f:
-            commands = [line.strip() for line in f if line.strip() and not line.startswith('#')]
-        return commands
+        return open(filename, 'r')
     except FileNotFoundError:
         print(f"Error: File '{filename}' not found.")
         print("Please make sure the file exists in the same directory as the script.")
@@ -130,43 +240,51 @@ def read_commands(filename):
         print(f"Error reading file: {e}")
         sys.exit(1)
 
+def is_command(line):
+    """True for lines that hold a command (not blank, not a '#' comment)."""
+    return bool(line.strip()) and not line.startswith('#')
+
+def count_commands(filename):
+    """Counts the commands in a file without keeping them in memory."""
+    with open_commands(filename) as f:
+        return sum(1 for line in f if is_command(line))
+
+def iter_commands(filename):
+    """Yields the commands from a file one at a time."""
+    with open_commands(filename) as f:
+        for line in f:
+            if is_command(line):
+                yield line.strip()
+
 def get_user_inputs():
     """Gets command file and delay from user."""
-    command_file = input("\nEnter the name of the command file (default: commands.txt): ").strip()
+    try:
+        command_file = input("\nEnter the name of the command file (default: commands.txt): ").strip()
+    except EOFError:
+        print("\nNo input available. Exiting.")
+        sys.exit(1)
     if not command_file:
         command_file = "commands.txt"
 
-    while True:
-        try:
-            delay_input = input("Enter the delay in seconds between commands (default: 3): ").strip()
-            delay = int(delay_input) if delay_input else 3
-            if delay < 0:
-                print("Delay must be non-negative.")
-                continue
-            return command_file, delay
-        except ValueError:
-            print("Invalid input. Please enter a number.")
-        except KeyboardInterrupt:
-            print("\nOperation cancelled.")
-            sys.exit(0)
+    delay = prompt_int("Enter the delay in seconds between commands (default: 3): ", 0, default=3)
+    return command_file, delay
 
-def execute_command_in_tab(distro, wsl_username, command, is_first=False):
-    """
-    Executes a command in a Windows Terminal tab as a specific user.
-    Uses a temporary script file to avoid argument parsing issues and
-    uses 'bash -i' to ensure the user's .bashrc is loaded.
-    """
+RUNNER_SCRIPT_NAME = "nexus_runner.sh"
 
-    # Create a temporary script file in Windows temp directory with Unix line endings
-    try:
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.sh', delete=False, dir=os.environ.get('TEMP'), newline='\n') as f:
-            script_content = f"""#!/bin/bash
+RUNNER_SCRIPT = """#!/bin/bash
+# Shared runner for every tab. The command arrives base64-encoded in $1
+# so it survives wt/wsl argument parsing untouched.
 # The '-i' flag used to launch this script should load .bashrc
+NEXUS_CMD="$(printf '%s' "$1" | base64 -d)"
+
+# All tabs open at once, so each one waits its turn here ($2 seconds)
+sleep "${2:-0}"
+
 # Go to the user's home directory
 cd ~
 
 # Run the command
-{command}
+eval "$NEXUS_CMD"
 
 # Keep the shell open for interaction
 echo ""
@@ -175,52 +293,82 @@ echo "Command completed. Press Ctrl+D to close or continue using the shell."
 echo "-------------------------------------------------------------------"
 exec bash
 """
-            f.write(script_content)
-            temp_script_path = f.name
 
+def write_runner_script():
+    """
+    Writes the shared runner script to the Windows temp directory once
+    and returns its path as seen from inside WSL.
+    """
+    script_path = os.path.join(TEMP_DIR, RUNNER_SCRIPT_NAME)
+    try:
+        # Unix line endings, otherwise bash chokes on the '\r'
+        with open(script_path, 'w', newline='\n') as f:
+            f.write(RUNNER_SCRIPT)
     except Exception as e:
-        print(f"Error: Could not create temporary script file: {e}")
-        return False
+        print(f"Error: Could not create runner script file: {e}")
+        sys.exit(1)
+
+    return f"{WSL_TEMP_ROOT}/{RUNNER_SCRIPT_NAME}"
+
+def build_tab_args(distro, wsl_username, runner_path, command, start_delay):
+    """
+    Builds the 'new-tab' arguments for one command, run as a specific user.
+    The command is handed to the shared runner script base64-encoded to
+    avoid argument parsing issues, and 'bash -i' ensures the user's
+    .bashrc is loaded.
+    """
+    # base64 output has no spaces, quotes or ';', so wt and wsl pass it through as-is
+    encoded_command = base64.b64encode(command.encode('utf-8')).decode('ascii')
 
-    # Convert Windows path (like 'C:\Users\...\temp.sh') to WSL path (like '/mnt/c/Users/.../temp.sh')
-    wsl_script_path = temp_script_path.replace('\\', '/').replace(':', '', 1)
-    wsl_script_path = f"/mnt/{wsl_script_path[0].lower()}{wsl_script_path[1:]}"
-
-    # Build the Windows Terminal command
-    # This now includes '-u {wsl_username}' to run as the correct user
-    wt_cmd_base = ['wt']
-    if is_first:
-        # Create new window, new tab
-        wt_cmd_args = ['-w', '-1', 'nt']
-    else:
-        # Use existing window, add new tab
-        wt_cmd_args = ['-w', '0', 'nt']
-
-    # Add the WSL command part
     # We use 'bash -i' (interactive) to force loading .bashrc and the PATH
-    wsl_cmd = [
+    return [
+        'nt',
         'wsl', '-d', distro,
         '-u', wsl_username,
-        'bash', '-i', wsl_script_path
+        'bash', '-i', runner_path, encoded_command, str(start_delay)
     ]
 
-    wt_cmd = wt_cmd_base + wt_cmd_args + wsl_cmd
+def launch_wt(wt_cmd):
+    """Runs a single wt command line and waits for wt.exe to hand it off."""
 
     # DEBUG: Print the exact command being executed
     # print(f"DEBUG: Executing command (as list):")
     # print(f"  {' '.join(wt_cmd)}")
-    # print(f"  Temp Script Path (Windows): {temp_script_path}")
-    # print(f"  Temp Script Path (WSL):     {wsl_script_path}")
     # print()
 
+    # Fully detach wt.exe: no console or inherited handles, and break out of
+    # any job object (IDEs, schedulers) so the tabs survive this script exiting.
+    detached_flags = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
     try:
         # Use Popen to launch the command in a new, detached process
-        subprocess.Popen(
-            wt_cmd,
-            creationflags=subprocess.CREATE_NEW_PROCESS_GROUP,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
+        try:
+            proc = subprocess.Popen(
+                wt_cmd,
+                creationflags=detached_flags | subprocess.CREATE_BREAKAWAY_FROM_JOB,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                close_fds=True
+            )
+        except PermissionError:
+            # The job we're in doesn't allow breakaway, launch inside it instead
+            proc = subprocess.Popen(
+                wt_cmd,
+                creationflags=detached_flags,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                close_fds=True
+            )
+        # wt.exe should hand the tabs over to Windows Terminal and exit quickly.
+        # If it hangs, kill it rather than leaving it around forever.
+        try:
+            proc.wait(timeout=WT_LAUNCH_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print(f"Error: `wt` did not finish launching within {WT_LAUNCH_TIMEOUT}s, killing it.")
+            # Only wt.exe itself: its child WindowsTerminal.exe may host other windows
+            proc.kill()
+            return False
         return True
     except FileNotFoundError:
         print("Error: `wt` (Windows Terminal) command not found.")
@@ -228,13 +376,33 @@ exec bash
         return False
     except Exception as e:
         print(f"Error executing command: {e}")
-        # Clean up the temp file on error
-        try:
-            os.unlink(temp_script_path)
-        except:
-            pass # Ignore cleanup errors
         return False
 
+def launch_tabs(distro, wsl_username, runner_path, commands, total, delay):
+    """
+    Opens one Windows Terminal tab per command, all from a single wt command
+    line joined with ';'. The delay between commands is applied inside each
+    tab, so tab N starts its command (N-1) * delay seconds after the first.
+    `commands` may be any iterable; `total` is only used for progress output.
+    """
+    # First batch creates a new window, any further batches add to it
+    wt_cmd = ['wt', '-w', '-1']
+    tabs_in_cmd = 0
+    for i, command in enumerate(commands):
+        print(f"[{i + 1}/{total}] Command (starts after {i * delay}s): {command}")
+        tab_args = build_tab_args(distro, wsl_username, runner_path, command, i * delay)
+        if tabs_in_cmd:
+            tab_args = [';'] + tab_args
+            if len(subprocess.list2cmdline(wt_cmd + tab_args)) > WT_MAX_CMDLINE:
+                if not launch_wt(wt_cmd):
+                    return False
+                wt_cmd = ['wt', '-w', '0']
+                tab_args = tab_args[1:]
+                tabs_in_cmd = 0
+        wt_cmd += tab_args
+        tabs_in_cmd += 1
+    return launch_wt(wt_cmd)
+
 def main():
     """Main function."""
     print("=" * 60)
@@ -248,16 +416,25 @@ def main():
         print("Please ensure WSL is installed and you have at least one distro.")
         sys.exit(1)
 
+    # Probe every distro for users up front. Each probe just waits on
+    # wsl.exe, so running them in threads overlaps the cold-starts.
+    print(f"\nDetecting users in {len(distros)} distribution(s)...")
+    with ThreadPoolExecutor(max_workers=min(8, len(distros))) as executor:
+        distro_users = dict(executor.map(probe_wsl, distros))
+
+    # Only offer distros that have at least one valid user
+    usable_distros = [distro for distro in distros if distro_users[distro]]
+    if not usable_distros:
+        print("Error: No valid users found in any WSL distribution.")
+        print("A valid user (like 'root' or a user with UID >= 1000) must exist.")
+        sys.exit(1)
+
     # Select distribution
-    selected_distro = select_distro(distros)
+    selected_distro = select_distro(usable_distros)
     print(f"\nSelected distribution: {selected_distro}")
 
     # --- NEW SECTION: Get the WSL username ---
-    users = get_wsl_users(selected_distro)
-    if not users:
-        print(f"Error: No valid users found in {selected_distro}.")
-        print("A valid user (like 'root' or a user with UID >= 1000) must exist.")
-        sys.exit(1)
+    users = distro_users[selected_distro]
     
     wsl_username = select_user(users)
     print(f"\nWill run commands as user: {wsl_username}")
@@ -266,39 +443,29 @@ def main():
     # Get user inputs (file and delay)
     command_file, delay = get_user_inputs()
 
-    # Read commands
-    commands = read_commands(command_file)
-    if not commands:
+    # Count commands (they are streamed from the file again when launching)
+    total = count_commands(command_file)
+    if not total:
         print(f"No valid commands found in {command_file}.")
         sys.exit(1)
 
-    print(f"\nFound {len(commands)} command(s) to execute.")
+    print(f"\nFound {total} command(s) to execute.")
     print(f"Delay between commands: {delay} second(s)")
+
+    # Write the shared runner script once for all commands
+    runner_path = write_runner_script()
+
     print("\nStarting execution in 3 seconds...")
     time.sleep(3)
 
-    # Execute commands
-    for i, command in enumerate(commands, 1):
-        is_first = (i == 1)
-        print(f"[{i}/{len(commands)}] Launching command: {command}")
-
-        # Pass the wsl_username to the function
-        if execute_command_in_tab(selected_distro, wsl_username, command, is_first):
-            if i < len(commands):
-                # Wait before next command (but not after the last one)
-                print(f"    ... waiting {delay} second(s)...")
-                time.sleep(delay)
-        else:
-            print(f"Failed to launch command: {command}")
-            response = input("Continue with remaining commands? (y/n): ").strip().lower()
-            if response != 'y':
-                print("Stopping execution.")
-                break
+    # Launch every command as a tab in one go
+    commands = iter_commands(command_file)
+    if not launch_tabs(selected_distro, wsl_username, runner_path, commands, total, delay):
+        print("Failed to launch commands.")
+        sys.exit(1)
 
     print("\n" + "=" * 60)
     print("Execution complete!")
-    print("Note: Temporary script files are left in your Temp folder.")
-    print(r"(Usually C:\Users\YourUser\AppData\Local\Temp)")
     print("=" * 60)
 
 if __name__ == "__main__":